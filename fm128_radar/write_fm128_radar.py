@@ -4,6 +4,9 @@ license:        APACHE 2.0
 author:         Ronald van Haren, NLeSC (r.vanharen@esciencecenter.nl)
 '''
 
+import os
+import re
+from decimal import Decimal
 import numpy
 
 
@@ -28,6 +31,8 @@ class write_fm128_radar:
     :param rv_err: error on radial velocity
     :param outfile: output filename of FM128_RADAR ascii file
     :param single: has reflection angle its own distinct lon/lat grid?
+    :param dry_run: only validate the input and compute the output size,
+        do not write the output file
     :type radar_name: str
     :type lat0: float
     :type lon0: float
@@ -44,10 +49,32 @@ class write_fm128_radar:
     :type rv_err: numpy.ndarray
     :type outfile: str
     :type single: bool
+    :type dry_run: bool
+
+    After initialization the following attributes are available, also
+    for a dry run:
+        - nobs: number of observations (FM-128 RADAR lines) per radar
+        - nlevs: number of measurement lines per radar
+        - nbytes: size of the output file [bytes]
     '''
+    # fixed width formats of the lines in the output file
+    fmt_file_header = "%14s%3i"
+    fmt_header = "%5s%2s%12s%8.3f%2s%8.3f%2s%8.1f%2s%19s%6i%6i"
+    fmt_data = "%12s%3s%19s%2s%12.3f%2s%12.3f%2s%8.1f%2s%6i"
+    fmt_measurement = "%3s%12.1f%12.3f%4i%12.3f%2s%12.3f%4i%12.3f%2s"
+    file_separator = "#-----------------------------#"
+    header_separator = (
+        '#---------------------------------------------------------#')
+
     def __init__(self, radar_name, lat0, lon0, elv0, date, lat,
                  lon, elv, rf, rf_qc, rf_err,
-                 rv, rv_qc, rv_err, outfile='fm128_radar.out', single=True):
+                 rv, rv_qc, rv_err, outfile='fm128_radar.out', single=True,
+                 dry_run=False):
+        # validate all fields and compute the output size before writing
+        self.preflight(radar_name, lat0, lon0, elv0, date, lat, lon, elv,
+                       rf, rf_qc, rf_err, rv, rv_qc, rv_err, single)
+        if dry_run:
+            return
         if ((isinstance(radar_name, (list, numpy.ndarray))
              and (len(radar_name) > 1))):
             # multiple radars in output file
@@ -105,10 +132,9 @@ class write_fm128_radar:
         :type outfile: str
         '''
         self.f = open(outfile, 'w')
-        fmt = "%14s%3i"
-        self.f.write(fmt % ("TOTAL RADAR = ", nrad))
+        self.f.write(self.fmt_file_header % ("TOTAL RADAR = ", nrad))
         self.f.write("\n")
-        self.f.write("%s" % ("#-----------------------------#"))
+        self.f.write("%s" % (self.file_separator))
         self.f.write("\n")
         self.f.write("\n")
 
@@ -118,6 +144,233 @@ class write_fm128_radar:
         '''
         self.f.close()
 
+    def preflight(self, radar_name, lat0, lon0, elv0, date, lat, lon, elv,
+                  rf, rf_qc, rf_err, rv, rv_qc, rv_err, single=True):
+        '''
+        Check all fields of all radars against the width of their fixed
+        width format and compute the exact size of the output file,
+        without formatting any data. Sets the attributes:
+            - nobs: number of observations (FM-128 RADAR lines) per radar
+            - nlevs: number of measurement lines per radar
+            - nbytes: size of the output file [bytes]
+
+        Parameters are the same as for the class constructor.
+
+        :raises ValueError: if the per radar inputs differ in length or
+            if any written integer field is masked or non-finite, or any
+            written field does not fit its format width
+        '''
+        if ((isinstance(radar_name, (list, numpy.ndarray))
+             and (len(radar_name) > 1))):
+            # multiple radars in output file
+            nrad = len(radar_name)
+            inputs = [('lat0', lat0), ('lon0', lon0), ('elv0', elv0),
+                      ('date', date), ('lat', lat), ('lon', lon),
+                      ('elv', elv), ('rf', rf), ('rf_qc', rf_qc),
+                      ('rf_err', rf_err), ('rv', rv), ('rv_qc', rv_qc),
+                      ('rv_err', rv_err)]
+            for name, data in inputs:
+                if len(data) != nrad:
+                    raise ValueError(
+                        'Length of %s (%i) does not match the number of '
+                        'radars (%i)' % (name, len(data), nrad))
+            radars = list(zip(radar_name, lat0, lon0, elv0, date, lat, lon,
+                              elv, rf, rf_qc, rf_err, rv, rv_qc, rv_err))
+        else:
+            # one radar in output file
+            radars = [(radar_name, lat0, lon0, elv0, date, lat, lon, elv,
+                       rf, rf_qc, rf_err, rv, rv_qc, rv_err)]
+        nl = len(os.linesep)
+        header_bytes = (self.get_line_length(self.fmt_header) + nl +
+                        len(self.header_separator) + 2 * nl)
+        data_bytes = self.get_line_length(self.fmt_data) + nl
+        measurement_bytes = self.get_line_length(self.fmt_measurement) + nl
+        errors = self.check_fields('file', self.fmt_file_header,
+                                   [(1, 'nrad', len(radars))])
+        self.nobs = []
+        self.nlevs = []
+        self.nbytes = (self.get_line_length(self.fmt_file_header) + nl +
+                       len(self.file_separator) + 2 * nl)
+        for (r_name, r_lat0, r_lon0, r_elv0, r_date, r_lat, r_lon, r_elv,
+             r_rf, r_rf_qc, r_rf_err, r_rv, r_rv_qc, r_rv_err) in radars:
+            # measurement lines are written for all unmasked reflectivities
+            written = ~numpy.ma.getmaskarray(r_rf)
+            if single:
+                max_levs = numpy.shape(r_elv)[0]
+                points = written.any(axis=0)
+            else:
+                max_levs = 1
+                points = written
+            dstring = r_date.strftime('%Y-%m-%d %H:%M:%S')
+            levs = written.sum(axis=0) if single else written
+            np = self.get_number_of_points(r_rf)
+            errors += self.check_fields(
+                r_name, self.fmt_header,
+                [(2, 'radar_name', r_name), (3, 'lon0', r_lon0),
+                 (5, 'lat0', r_lat0), (7, 'elv0', r_elv0),
+                 (9, 'date', dstring), (10, 'np', np),
+                 (11, 'max_levs', max_levs)])
+            errors += self.check_fields(
+                r_name, self.fmt_data,
+                [(4, 'lat', self.select(r_lat, points)),
+                 (6, 'lon', self.select(r_lon, points)),
+                 (10, 'levs', self.select(levs, points))])
+            errors += self.check_fields(
+                r_name, self.fmt_measurement,
+                [(1, 'elv', self.select(r_elv, written)),
+                 (2, 'rv', self.select(r_rv, written)),
+                 (3, 'rv_qc', self.select(r_rv_qc, written)),
+                 (4, 'rv_err', self.select(r_rv_err, written)),
+                 (6, 'rf', self.select(r_rf, written)),
+                 (7, 'rf_qc', self.select(r_rf_qc, written)),
+                 (8, 'rf_err', self.select(r_rf_err, written))])
+            nobs = int(numpy.count_nonzero(points))
+            nlevs = int(numpy.count_nonzero(written))
+            self.nobs.append(nobs)
+            self.nlevs.append(nlevs)
+            self.nbytes += (header_bytes + nobs * data_bytes +
+                            nlevs * measurement_bytes)
+        if errors:
+            raise ValueError('Fields can not be written in the FM128_RADAR '
+                             'format:\n' +
+                             '\n'.join(errors))
+
+    @staticmethod
+    def select(data, selection):
+        '''
+        Return the values of data that are written to the output file.
+        The mask of a masked array is kept, so masked values at written
+        positions can be reported.
+
+        :param data: (masked) array of data
+        :param selection: boolean array of values that are written
+        :type data: numpy.ndarray
+        :type selection: numpy.ndarray
+        :returns: values that are written to the output file
+        :rtype: numpy.ndarray
+        '''
+        return numpy.ma.asanyarray(data)[selection]
+
+    @staticmethod
+    def get_format_fields(fmt):
+        '''
+        Return the fields of a fixed width format
+
+        :param fmt: fixed width format, e.g. "%12s%8.3f%6i"
+        :type fmt: str
+        :returns: width, precision and conversion type of each field
+        :rtype: list
+        '''
+        return [(int(width), int(precision) if precision else None, conv)
+                for width, precision, conv in
+                re.findall(r'%(\d+)(?:\.(\d+))?([sif])', fmt)]
+
+    @classmethod
+    def get_line_length(cls, fmt):
+        '''
+        Return the length of a line written with a fixed width format,
+        given that all fields fit their width
+
+        :param fmt: fixed width format
+        :type fmt: str
+        :returns: length of the line, excluding the line separator
+        :rtype: int
+        '''
+        return sum(width for width, _, _ in cls.get_format_fields(fmt))
+
+    @staticmethod
+    def fits_field(values, width, precision, conv):
+        '''
+        Return which values fit the width of a format field, without
+        formatting the values:
+            - %s: length of the string representation
+            - %i: number of digits of the truncated value, including sign
+            - %f: number of digits of the rounded value, including sign;
+              the boundary is exact, the largest float that is rounded
+              to a value that fits is accepted
+        Non-finite values (nan, inf) are always accepted.
+
+        :param values: values to check
+        :param width: width of the format field
+        :param precision: precision of the format field
+        :param conv: conversion type of the format field (s, i or f)
+        :type values: numpy.ndarray
+        :type width: int
+        :type precision: int
+        :type conv: str
+        :returns: boolean array, True where the value fits the field
+        :rtype: numpy.ndarray
+        '''
+        if conv == 's':
+            return numpy.array(len(str(values)) <= width)
+        values = numpy.asarray(values, dtype=float)
+        finite = numpy.isfinite(values)
+        with numpy.errstate(invalid='ignore'):
+            if conv == 'i':
+                trunc = numpy.trunc(values)
+                return ~finite | ((trunc < 10 ** width) &
+                                  (trunc > -10 ** (width - 1)))
+            limits = []
+            for sign in (0, 1):
+                # width available for the digits in front of the decimal
+                # point, values from the boundary on are rounded up to an
+                # extra digit (ties are rounded to the even 10 ** digits)
+                digits = width - precision - 1 - sign
+                boundary = (Decimal(10) ** digits -
+                            Decimal(5) * Decimal(10) ** -(precision + 1))
+                # largest float below the exact decimal boundary
+                limit = float(boundary)
+                if Decimal(limit) >= boundary:
+                    limit = numpy.nextafter(limit, 0)
+                limits.append(limit)
+            limit = numpy.where(numpy.signbit(values), limits[1], limits[0])
+            return ~finite | (numpy.abs(values) <= limit)
+
+    @classmethod
+    def check_fields(cls, radar_name, fmt, fields):
+        '''
+        Check values against the width of their fields in a format.
+        Masked values of float fields are written as nan and, like other
+        non-finite values, are accepted. For integer fields masked and
+        non-finite values cannot be written and are reported separately.
+
+        :param radar_name: name of radar, used in error messages
+        :param fmt: fixed width format
+        :param fields: list of (field index, field name, values)
+        :type radar_name: str
+        :type fmt: str
+        :type fields: list
+        :returns: error messages for fields that can not be written or
+            overflow their width
+        :rtype: list
+        '''
+        format_fields = cls.get_format_fields(fmt)
+        errors = []
+        for index, name, values in fields:
+            width, precision, conv = format_fields[index]
+            if conv != 's':
+                masked = numpy.ma.getmaskarray(values)
+                values = numpy.ma.getdata(values)[~masked]
+                nmasked = numpy.count_nonzero(masked)
+                if conv == 'i':
+                    if nmasked:
+                        errors.append('%s: %i masked value(s) of %s' %
+                                      (radar_name, nmasked, name))
+                    nonfinite = ~numpy.isfinite(
+                        numpy.asarray(values, dtype=float))
+                    if numpy.count_nonzero(nonfinite):
+                        errors.append('%s: %i non-finite value(s) of %s' %
+                                      (radar_name,
+                                       numpy.count_nonzero(nonfinite), name))
+            noverflow = numpy.count_nonzero(
+                ~cls.fits_field(values, width, precision, conv))
+            if noverflow:
+                spec = ('%%%i%s' % (width, conv) if precision is None
+                        else '%%%i.%i%s' % (width, precision, conv))
+                errors.append('%s: %i value(s) of %s do not fit %s' %
+                              (radar_name, noverflow, name, spec))
+        return errors
+
     def write_header(self, radar_name, lon0, lat0, elv0, date, np, max_levs):
         '''
         Write the radar specific header to the output file
@@ -137,17 +390,15 @@ class write_fm128_radar:
         :type np: int
         :type max_levs: int
         '''
-        # define header format
-        fmt = "%5s%2s%12s%8.3f%2s%8.3f%2s%8.1f%2s%19s%6i%6i"
         # add temporary test data
         name = 'RADAR'
         hor_spacing = ''
+        fmt = self.fmt_header
         self.f.write(fmt % (name, hor_spacing, radar_name, lon0, hor_spacing,
                             lat0, hor_spacing, elv0, hor_spacing, date,
                             np, max_levs))
         self.f.write("\n")
-        self.f.write("%s" % (
-            '#---------------------------------------------------------#'))
+        self.f.write("%s" % (self.header_separator))
         self.f.write("\n")
         self.f.write("\n")
 
@@ -218,7 +469,7 @@ class write_fm128_radar:
         :type rf_qc: numpy.ndarray
         :type rf_err: numpy.ndarray
         '''
-        fmt = "%12s%3s%19s%2s%12.3f%2s%12.3f%2s%8.1f%2s%6i"
+        fmt = self.fmt_data
         hor_spacing = ''
         # loop over horizontal data points
         for m in range(0, numpy.shape(lat)[0]):  # vertical levels
@@ -286,7 +537,7 @@ class write_fm128_radar:
         :type rf_qc: numpy.ndarray
         :type rf_err: numpy.ndarray
         '''
-        fmt = "%12s%3s%19s%2s%12.3f%2s%12.3f%2s%8.1f%2s%6i"
+        fmt = self.fmt_data
         hor_spacing = ''
         # loop over horizontal data points
         for i in range(0, numpy.shape(lat)[0]):
@@ -348,7 +599,7 @@ class write_fm128_radar:
         :type rf_qc: float
         :type rf_err: float
         '''
-        fmt_2 = "%3s%12.1f%12.3f%4i%12.3f%2s%12.3f%4i%12.3f%2s"
+        fmt_2 = self.fmt_measurement
         self.f.write(fmt_2 % (hor_spacing, elv,
                               rv_data, rv_qc,
                               rv_err, hor_spacing,
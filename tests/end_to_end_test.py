@@ -108,5 +108,148 @@ class end2endtest(unittest.TestCase):
         testfile = os.path.join(self.test_data, 'fm128_radar.multiple2')
         self.assertEqual(filecmp.cmp(self.outputfile,  testfile), 1)
 
+    def test_04(self):
+        '''
+        Test dry run computes the output size without writing the file
+        '''
+        outputfile = 'fm128_radar.dry_run'
+        # run pre-flight pass only
+        fm128 = write_fm128_radar(self.radar_name, self.lat0, self.lon0,
+                                  self.elv0, self.time, self.latitude,
+                                  self.longitude, self.altitude, self.rf,
+                                  self.rf_qc, self.rf_err, self.rv,
+                                  self.rv_qc, self.rv_err,
+                                  outfile=outputfile, single=True,
+                                  dry_run=True)
+        # test that no output file is written
+        self.assertFalse(os.path.exists(outputfile))
+        # check observation counts and size of the sample file
+        testfile = os.path.join(self.test_data, 'fm128_radar.single')
+        self.assertEqual(fm128.nobs, [12])
+        self.assertEqual(fm128.nlevs, [24])
+        self.assertEqual(fm128.nbytes, os.path.getsize(testfile))
+
+    def test_05(self):
+        '''
+        Test masked values are excluded from counts and output size
+        '''
+        self.rf = np.ma.masked_array(self.rf, mask=np.zeros((2, 3, 4)))
+        self.rf.mask[0, 0, :] = True
+        self.rf.mask[:, 1, 1] = True
+        # masked values do not need to fit their format
+        self.rv_err[:, 1, 1] = 1e20
+        fm128 = write_fm128_radar(self.radar_name, self.lat0, self.lon0,
+                                  self.elv0, self.time, self.latitude,
+                                  self.longitude, self.altitude, self.rf,
+                                  self.rf_qc, self.rf_err, self.rv,
+                                  self.rv_qc, self.rv_err,
+                                  outfile=self.outputfile, single=True)
+        self.assertEqual(fm128.nobs, [11])
+        self.assertEqual(fm128.nlevs, [18])
+        self.assertEqual(fm128.nbytes, os.path.getsize(self.outputfile))
+
+    def test_06(self):
+        '''
+        Test fields that overflow their format width are rejected
+        '''
+        outputfile = 'fm128_radar.overflow'
+        self.radar_name = ['radar1', 'radar_name_too_long']
+        self.time = [datetime(2002, 2, 2), datetime(2002, 2, 2)]
+        self.latitude = 51.2 * np.ones((2, 3, 4))
+        self.longitude = 11.2 * np.ones((2, 3, 4))
+        self.altitude = 422 * np.ones((2, 2, 3, 4))
+        self.lat0 = [50.3, 41.2]
+        self.lon0 = [10.6, 9.4]
+        self.elv0 = [11.4, 12.2]
+        self.rf = 4.2 * np.ones((2, 2, 3, 4))
+        self.rf_qc = 0 * np.ones((2, 2, 3, 4))
+        self.rf_err = 1.3 * np.ones((2, 2, 3, 4))
+        self.rv = 7 * np.ones((2, 2, 3, 4))
+        self.rv_qc = 0 * np.ones((2, 2, 3, 4))
+        self.rv_err = 2 * np.ones((2, 2, 3, 4))
+        self.rv[0, 1, 2, 3] = -1e8
+        self.rf_qc[0, 0, 0, 0] = 12345
+        with self.assertRaises(ValueError) as context:
+            write_fm128_radar(self.radar_name, self.lat0, self.lon0,
+                              self.elv0, self.time, self.latitude,
+                              self.longitude, self.altitude, self.rf,
+                              self.rf_qc, self.rf_err, self.rv, self.rv_qc,
+                              self.rv_err, outfile=outputfile, single=True)
+        # test that no output file is written
+        self.assertFalse(os.path.exists(outputfile))
+        message = str(context.exception)
+        self.assertIn('radar1: 1 value(s) of rv do not fit %12.3f', message)
+        self.assertIn('radar1: 1 value(s) of rf_qc do not fit %4i', message)
+        self.assertIn('radar_name_too_long: 1 value(s) of radar_name do '
+                      'not fit %12s', message)
+
+    def test_07(self):
+        '''
+        Test masked float fields are accepted and masked or non-finite
+        integer fields at written positions are rejected
+        '''
+        outputfile = 'fm128_radar.masked'
+        # reflectivity is unmasked, so all measurement lines are written
+        self.rv = np.ma.masked_array(self.rv, mask=np.zeros((2, 3, 4)))
+        self.rv.mask[0, 1, 2] = True
+        fm128 = write_fm128_radar(self.radar_name, self.lat0, self.lon0,
+                                  self.elv0, self.time, self.latitude,
+                                  self.longitude, self.altitude, self.rf,
+                                  self.rf_qc, self.rf_err, self.rv,
+                                  self.rv_qc, self.rv_err,
+                                  outfile=outputfile, single=True,
+                                  dry_run=True)
+        testfile = os.path.join(self.test_data, 'fm128_radar.single')
+        self.assertEqual(fm128.nbytes, os.path.getsize(testfile))
+        self.rv_qc = np.ma.masked_array(self.rv_qc, mask=np.zeros((2, 3, 4)))
+        self.rv_qc.mask[1, 2, 3] = True
+        self.rf_qc[0, 0, 0] = np.nan
+        with self.assertRaises(ValueError) as context:
+            write_fm128_radar(self.radar_name, self.lat0, self.lon0,
+                              self.elv0, self.time, self.latitude,
+                              self.longitude, self.altitude, self.rf,
+                              self.rf_qc, self.rf_err, self.rv, self.rv_qc,
+                              self.rv_err, outfile=outputfile, single=True,
+                              dry_run=True)
+        message = str(context.exception)
+        self.assertNotIn('radar: 1 masked value(s) of rv',
+                         message.splitlines())
+        self.assertIn('radar: 1 masked value(s) of rv_qc', message)
+        self.assertIn('radar: 1 non-finite value(s) of rf_qc', message)
+        self.assertNotIn('do not fit', message)
+
+    def test_08(self):
+        '''
+        Test per radar inputs with a different length are rejected
+        '''
+        self.radar_name = ['radar1', 'radar2']
+        self.time = [datetime(2002, 2, 2), datetime(2002, 2, 2)]
+        self.lat0 = [50.3, 41.2, 45.0]
+        self.lon0 = [10.6, 9.4]
+        self.elv0 = [11.4, 12.2]
+        with self.assertRaises(ValueError) as context:
+            write_fm128_radar(self.radar_name, self.lat0, self.lon0,
+                              self.elv0, self.time, self.latitude,
+                              self.longitude, self.altitude, self.rf,
+                              self.rf_qc, self.rf_err, self.rv, self.rv_qc,
+                              self.rv_err, outfile=self.outputfile,
+                              single=True, dry_run=True)
+        self.assertIn('Length of lat0 (3) does not match the number of '
+                      'radars (2)', str(context.exception))
+
+    def test_09(self):
+        '''
+        Test float fields are accepted up to the exact rounding boundary
+        '''
+        cases = [(999999.95, '%8.1f', True), (-99999.95, '%8.1f', True),
+                 (9999.9995, '%8.3f', True), (999999.96, '%8.1f', False),
+                 (-99999.96, '%8.1f', False), (9999.9996, '%8.3f', False)]
+        for value, fmt, fits in cases:
+            width, precision, conv = \
+                write_fm128_radar.get_format_fields(fmt)[0]
+            self.assertEqual(len(fmt % value) <= width, fits)
+            self.assertEqual(bool(write_fm128_radar.fits_field(
+                value, width, precision, conv)), fits)
+
 if __name__ == "__main__":
     unittest.main()